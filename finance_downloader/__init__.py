@@ -0,0 +1 @@
+"""Shared download/zip pipeline behind the finance dashboard UI."""
@@ -0,0 +1,254 @@
+"""Download/zip pipeline for the finance dashboard, free of any UI code.
+
+``process`` takes the parsed CSV frame and a staging directory, downloads
+every Invoice/PaymentAdvice/Annexure URL straight into size-capped ZIP
+parts, and returns the part paths plus any URLs that failed.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+# Shared request headers — built once, reused for every download.
+# Transport compression is a no-op for PDFs but shrinks any JSON/HTML
+# responses; requests decodes transparently (brotli dep covers "br").
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept-Encoding": "gzip, deflate, br",
+}
+
+MAX_WORKERS = 16
+
+# (connect, read) seconds — bounds how long one hung URL can stall a
+# worker; retries below cover the transient cases.
+TIMEOUT = (5, 30)
+
+MAX_SIZE_MB = 23
+MAX_SIZE = MAX_SIZE_MB * 1024 * 1024  # bytes
+
+# One session shared by all worker threads: keep-alive connection pooling
+# means repeated requests to the same host reuse one TCP+TLS connection
+# instead of re-handshaking per file.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+    ),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# ZipFile is not thread-safe, so archive writes are serialized; the
+# network fetch happens outside the lock so workers still overlap.
+ZIP_LOCK = threading.Lock()
+
+# Persistent download cache: reruns mostly re-fetch identical PDFs, so
+# keep bodies keyed by URL hash and skip the GET when a cheap HEAD shows
+# the server's ETag and size are unchanged. The bodies are financial
+# documents, so the cache lives under the user's home (not the shared
+# system temp dir) and is readable only by the owning user.
+CACHE_DIR = os.path.expanduser("~/.cache/finance_downloader")
+MANIFEST_PATH = os.path.join(CACHE_DIR, "cache_manifest.json")
+MANIFEST_LOCK = threading.Lock()
+
+os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest):
+    # Write-then-replace so a crash mid-write can't corrupt the manifest.
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR)
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def _cache_path(url):
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode()).hexdigest())
+
+def _prune_cache(manifest):
+    # Drop cached bodies no longer referenced by the manifest (stale URLs,
+    # interrupted runs) so the cache can't grow without bound. scandir's
+    # DirEntry caches the file type from the directory read, so this is
+    # one listing pass with no extra stat per entry.
+    referenced = {_cache_path(url) for url in manifest}
+    referenced.add(MANIFEST_PATH)
+    for entry in os.scandir(CACHE_DIR):
+        if entry.is_file(follow_symlinks=False) and entry.path not in referenced:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+MANIFEST = _load_manifest()
+
+def fetch(url):
+    """Return the body at ``url``, served from the local cache when a HEAD
+    shows its ETag and size are unchanged since the last download."""
+    cached = MANIFEST.get(url)
+    cache_path = _cache_path(url)
+    if cached and cached.get("etag") and os.path.exists(cache_path):
+        try:
+            head = SESSION.head(url, allow_redirects=True, timeout=5)
+            if (
+                head.status_code == 200
+                and head.headers.get("ETag") == cached["etag"]
+                and int(head.headers.get("Content-Length", -1)) == cached["size"]
+            ):
+                with open(cache_path, "rb") as f:
+                    return f.read()
+        except Exception:
+            pass  # fall through to a full GET
+
+    response = SESSION.get(url, stream=True, timeout=TIMEOUT)
+    if response.status_code != 200:
+        print(f"Failed to download: {url}")
+        return None
+    # 64 KB chunks: ~64× fewer Python-level iterations and socket reads
+    # per file than the old 1 KB chunk size.
+    data = b"".join(response.iter_content(65536))
+
+    etag = response.headers.get("ETag")
+    if etag:
+        with open(cache_path, "wb") as f:
+            f.write(data)
+        with MANIFEST_LOCK:
+            MANIFEST[url] = {"etag": etag, "size": len(data)}
+    return data
+
+# Rough archive overhead per STORED entry: local + central headers plus
+# the name stored in each.
+_ZIP_ENTRY_OVERHEAD = 128
+
+class ZipSplitter:
+    """Spreads entries across standalone ZIP parts, each under max_size.
+
+    Rolls over to a new part whenever the next entry would push the
+    current one past the limit, so every part is a valid ZIP on its own.
+    Callers must serialize access to writestr (see ZIP_LOCK).
+    """
+
+    def __init__(self, temp_dir, max_size):
+        self.temp_dir = temp_dir
+        self.max_size = max_size
+        self.paths = []
+        self._zipf = None
+        self._bytes = 0
+        self._open_next()
+
+    def _open_next(self):
+        if self._zipf is not None:
+            self._zipf.close()
+        path = os.path.join(self.temp_dir, f"finance_output_part{len(self.paths) + 1}.zip")
+        self.paths.append(path)
+        # PDFs and XLSX are already compressed, so DEFLATE would burn CPU
+        # for ~0% size win — pin ZIP_STORED explicitly.
+        self._zipf = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._bytes = 0
+
+    def writestr(self, arcname, data):
+        entry_size = len(data) + len(arcname) + _ZIP_ENTRY_OVERHEAD
+        if self._bytes and self._bytes + entry_size > self.max_size:
+            self._open_next()
+        self._zipf.writestr(arcname, data)
+        self._bytes += entry_size
+
+    def close(self):
+        self._zipf.close()
+
+def download_file(zip_out, url, arcname):
+    """Fetch one file into the archive; returns the URL on failure."""
+    try:
+        data = fetch(url)
+    except Exception as e:
+        print(f"Error downloading {url}: {e}")
+        return url
+    if data is None:
+        return url
+    with ZIP_LOCK:
+        zip_out.writestr(arcname, data)
+    return None
+
+def build_jobs(df):
+    """Return (url, arcname) pairs for every non-empty URL cell.
+
+    Dates and path pieces are vectorized once per column, and the jobs
+    come back sorted by host so workers hit warm keep-alive connections
+    instead of interleaving hosts and re-handshaking.
+    """
+    df = df.copy()
+    df["dt"] = pd.to_datetime(df["dt"])
+    df["rid"] = df["restaurant_id"].astype(str)
+    df["year"] = df["dt"].dt.year.astype(str)
+    df["date_str"] = df["dt"].dt.strftime("%Y_%m_%d")
+
+    jobs = []
+
+    cols = ["rid", "year", "date_str", "invoice_url", "payment_advice_url", "annexure_url"]
+    for rid, year, date_str, invoice_url, pa_url, ann_url in df[cols].itertuples(index=False):
+
+        prefix = f"RID_{rid}/{year}"
+
+        if pd.notna(invoice_url):
+            jobs.append((invoice_url, f"{prefix}/Invoices/Invoice_{date_str}.pdf"))
+
+        if pd.notna(pa_url):
+            jobs.append((pa_url, f"{prefix}/Payment_Advices/Payment_Advice_{date_str}.pdf"))
+
+        if pd.notna(ann_url):
+            jobs.append((ann_url, f"{prefix}/Annexures/Annexure_{date_str}.xlsx"))
+
+    jobs.sort(key=lambda job: urlsplit(job[0]).netloc)
+    return jobs
+
+def process(df, temp_dir, auth=None, progress_callback=None):
+    """Download every file in ``df`` into ZIP parts under ``temp_dir``.
+
+    Returns (part_paths, failed_urls). ``progress_callback``, if given, is
+    called with the completed fraction after each download.
+    """
+    if auth:
+        SESSION.auth = auth
+
+    jobs = build_jobs(df)
+
+    # Network waits dominate, so N threads give ~N× throughput: the GIL is
+    # released during socket I/O and the shared session pools connections
+    # across workers. Each response body goes directly into the archive,
+    # so nothing is staged on disk and re-read. The splitter rolls over to
+    # a fresh part whenever the current one would exceed MAX_SIZE.
+    zip_out = ZipSplitter(temp_dir, MAX_SIZE)
+    failed_urls = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(download_file, zip_out, *job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            failed_url = future.result()
+            if failed_url:
+                failed_urls.append(failed_url)
+            if progress_callback:
+                progress_callback(done / len(futures))
+    zip_out.close()
+    _save_manifest(MANIFEST)
+    _prune_cache(MANIFEST)
+
+    return zip_out.paths, failed_urls